@@ -52,6 +52,14 @@ BOOK_NAME_MAP = {
     "II Chronicles": "II_Chronicles",
 }
 
+# Book-name patterns, longest first to avoid partial matches (e.g., 'I Kings' before 'Kings')
+_BOOK_PATTERNS = [
+    (book_key, re.compile(rf"\b{re.escape(book_key)}\b", re.IGNORECASE))
+    for book_key in sorted(BOOK_NAME_MAP, key=len, reverse=True)
+]
+# First numeric token (Roman or Arabic) after a book name
+_CHAPTER_NUM_RE = re.compile(r"\b([IVXLCDM]+|\d{1,3})\b", re.IGNORECASE)
+
 
 def roman_to_int(roman: str) -> Optional[int]:
     if not roman:
@@ -82,18 +90,17 @@ def extract_refs_from_title(title: str) -> List[Tuple[str, int]]:
 
     hay = title
 
-    # Sort book keys by length to avoid partial matches (e.g., 'I Kings' before 'Kings')
-    for book_key in sorted(BOOK_NAME_MAP.keys(), key=len, reverse=True):
+    for book_key, book_re in _BOOK_PATTERNS:
         # Case-insensitive search
-        m = re.search(rf"\b{re.escape(book_key)}\b", hay, flags=re.IGNORECASE)
+        m = book_re.search(hay)
         if not m:
             continue
         end = m.end()
         # Search up to next closing paren or end
         tail = hay[end:]
-        seg = re.split(r"[)]", tail, maxsplit=1)[0]
+        seg = tail.split(")", 1)[0]
         # Find the first numeric token (Roman or Arabic)
-        mnum = re.search(r"\b([IVXLCDM]+|\d{1,3})\b", seg, flags=re.IGNORECASE)
+        mnum = _CHAPTER_NUM_RE.search(seg)
         if not mnum:
             continue
         tok = mnum.group(1)
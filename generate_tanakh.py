@@ -4,21 +4,352 @@ Tanakh EPUB Generator for Kobo Libra Colour
 Generates a responsive Hebrew/English Bible with custom artwork
 """
 
+import os
 import time
 import argparse
 import re
+import struct
+import threading
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import json
+import mmap
+from bisect import insort
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import zip_longest
 
+import orjson
 import requests
 from ebooklib import epub
 from PIL import Image
 from jinja2 import Environment, FileSystemLoader
+from lxml import etree
+from lxml.builder import E
+from html import unescape
+from markupsafe import escape
 import io
+import zipfile
+
+# Verse cleanup pattern: leftover HTML tags
+_TAG_RE = re.compile(r"<[^>]+>")
+
+# JPEG start-of-image marker, and the size up to which a JPEG is embedded
+# without re-encoding (the bundled Chagall plates are well under this)
+JPEG_SOI = b"\xff\xd8"
+MAX_PASSTHROUGH_JPEG_BYTES = 300 * 1024
+
+# Number of book downloads kept in flight against the Sefaria API
+MAX_CONCURRENT_FETCHES = 8
+
+# Write buffer for the output file, so the archive goes out in large chunks
+EPUB_WRITE_BUFFER_BYTES = 1024 * 1024
+
+# Sefaria responses are kept here between runs; the text does not change, so
+# entries never expire. Delete the directory to force a fresh download
+TEXT_CACHE_DIR = Path(".sefaria_cache")
+
+# Throttling and transient server errors: back off (honoring Retry-After) before
+# retrying; other failures are retried straight away
+BACKOFF_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRY_DELAY = 60
+
+# Aggregate request rate across all fetch workers (cache hits don't count)
+MAX_REQUESTS_PER_SECOND = 20
+
+
+def _retry_delay(response, attempt: int) -> float:
+    """Seconds to wait before retry number attempt + 1: Retry-After if given, else 2, 4, ..."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), MAX_RETRY_DELAY)
+    return min(2 ** (attempt + 1), MAX_RETRY_DELAY)
+
+
+class _RateLimiter:
+    """Thread-safe token bucket: at most `rate` calls per second, in bursts of up to `rate`"""
+
+    def __init__(self, rate: float):
+        self._rate = rate
+        self._tokens = rate
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._rate, self._tokens + (now - self._stamp) * self._rate)
+            self._stamp = now
+            # Going below zero reserves a future slot, so later callers queue behind us
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) do not
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(buf: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG's frame header without decoding it.
+
+    Walks the marker segments up to the first SOFn. Returns None if the
+    buffer is not a JPEG or the header is missing or truncated.
+    """
+    if buf[:2] != JPEG_SOI:
+        return None
+    i = 2
+    n = len(buf)
+    while i + 4 <= n:
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Standalone markers have no length field
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # End of image / start of scan reached without a frame header
+            return None
+        (seg_len,) = struct.unpack(">H", buf[i + 2 : i + 4])
+        if marker in _JPEG_SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack(">HH", buf[i + 5 : i + 9])
+            return (width, height) if width and height else None
+        i += 2 + seg_len
+    return None
+
+
+def _map_file(path):
+    """Map a file read-only instead of copying it into a bytes object.
+
+    The mapping outlives the descriptor, so no file stays open while the
+    book is assembled. Empty files return b"" since they cannot be mapped.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Scratch buffer reused by every re-encode in this process (each pool worker
+# gets its own copy)
+_reencode_buf = io.BytesIO()
+
+
+def _reencode_jpeg(path: str) -> bytes:
+    """Decode an image file and re-save it as an optimized quality-85 JPEG"""
+    _reencode_buf.seek(0)
+    _reencode_buf.truncate()
+    with Image.open(path) as img:
+        img.save(_reencode_buf, format="JPEG", quality=85, optimize=True)
+    with _reencode_buf.getbuffer() as view:
+        return bytes(view)
+
+
+def _hebrew_numeral(num: int) -> str:
+    """Convert number to Hebrew numeral"""
+    ones = ["", "א", "ב", "ג", "ד", "ה", "ו", "ז", "ח", "ט"]
+    tens = ["", "י", "כ", "ל", "מ", "נ", "ס", "ע", "פ", "צ"]
+    hundreds = ["", "ק", "ר", "ש", "ת"]
+
+    if num >= 1000:
+        return str(num)
+
+    result = ""
+    if num >= 100:
+        result += hundreds[num // 100]
+        num %= 100
+    if num >= 10:
+        result += tens[num // 10]
+        num %= 10
+    if num > 0:
+        result += ones[num]
+
+    if len(result) > 1:
+        result = result[:-1] + "״" + result[-1:]
+    elif len(result) == 1:
+        result = result + "׳"
+
+    return result
+
+
+# Numerals for 0-499, built once at import; every chapter number falls in range
+_HEBREW_NUMERALS = tuple(_hebrew_numeral(n) for n in range(500))
+
+
+class ChapterText(NamedTuple):
+    """Cleaned verses of one chapter, in order"""
+
+    hebrew: list
+    english: list
+
+
+# Archive members that are already compressed; deflating them again costs CPU
+# for next to no size gain
+_STORED_SUFFIXES = (".jpg", ".jpeg", ".png", ".ttf", ".otf", ".woff", ".woff2")
+
+
+class _EpubZipFile(zipfile.ZipFile):
+    """ZipFile that stores pre-compressed assets and deflates text at level 1"""
+
+    def __init__(self, file, mode="r"):
+        super().__init__(file, mode, zipfile.ZIP_DEFLATED, compresslevel=1)
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        name = getattr(zinfo_or_arcname, "filename", zinfo_or_arcname)
+        if compress_type is None and name.lower().endswith(_STORED_SUFFIXES):
+            compress_type = zipfile.ZIP_STORED
+        super().writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+
+
+class _EpubWriter(epub.EpubWriter):
+    """ebooklib writer that packs the archive with _EpubZipFile"""
+
+    def write(self):
+        self.out = _EpubZipFile(self.file_name, "w")
+        self.out.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        self._write_container()
+        self._write_opf()
+        self._write_items()
+        self.out.close()
+
+
+# Static front-matter pages, shared by every generate() call
+_DEDICATION_HTML = """
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+    <title>Dedication</title>
+    <link rel="stylesheet" type="text/css" href="style.css"/>
+    <style>
+        .dedication {
+            margin: 30% auto;
+            text-align: center;
+            font-style: italic;
+            max-width: 80%;
+        }
+        .dedication h2 {
+            font-size: 1.5em;
+            margin-bottom: 1em;
+            font-weight: normal;
+        }
+        .dedication p {
+            font-size: 1.1em;
+            line-height: 1.8;
+            margin: 0.5em 0;
+        }
+        .dedication .name {
+            font-size: 1.2em;
+            margin-top: 2em;
+            font-weight: bold;
+        }
+        .dedication .link {
+            font-size: 0.9em;
+            margin-top: 1em;
+            color: #667eea;
+        }
+    </style>
+</head>
+<body>
+    <div class="dedication">
+        <h2>Dedication</h2>
+        <p>This edition of the Tanakh is dedicated with love to</p>
+        <p class="name">Bruno "DaVenzia" Naphtali</p>
+        <p>He saved my life</p>
+        <p class="link">
+            <a href="https://www.instagram.com/brunodavenzia/">@brunodavenzia</a>
+        </p>
+    </div>
+</body>
+</html>
+"""
+
+_ATTRIBUTION_HTML = """
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+    <title>Artwork Attribution</title>
+    <link rel="stylesheet" type="text/css" href="style.css"/>
+    <style>
+        .attribution {
+            margin: 20% auto;
+            text-align: center;
+            max-width: 80%;
+        }
+        .attribution h2 {
+            font-size: 1.4em;
+            margin-bottom: 1em;
+        }
+        .attribution p {
+            font-size: 1em;
+            line-height: 1.6;
+            margin: 0.5em 0;
+        }
+        .attribution .artist {
+            font-weight: bold;
+            font-size: 1.1em;
+            margin: 1em 0;
+        }
+        .attribution .source {
+            font-style: italic;
+            color: #667eea;
+            margin-top: 1.5em;
+        }
+        .attribution a {
+            color: #667eea;
+            text-decoration: none;
+        }
+    </style>
+</head>
+<body>
+    <div class="attribution">
+        <h2>Artwork Attribution</h2>
+        <p class="artist">Marc Chagall Bible Illustrations</p>
+        <p>This edition includes beautiful Bible illustrations by Marc Chagall,</p>
+        <p>one of the most celebrated artists of the 20th century.</p>
+        <p>His unique vision brings the ancient texts to life with</p>
+        <p>vibrant colors and dreamlike imagery.</p>
+        <p class="source">
+            Images courtesy of artchive.com<br/>
+            <a href="https://www.artchive.com/?s=chagall+bible">
+                www.artchive.com/?s=chagall+bible
+            </a>
+        </p>
+    </div>
+</body>
+</html>
+"""
 
 
 class TanakhGenerator:
+    # Stylesheet used when templates/style_minimal.css is missing
+    _FALLBACK_CSS = """
+        body { font-family: Georgia, serif; line-height: 1.6; margin: 1em; }
+        .chapter-container { margin: 0 auto; padding: 1em; }
+        .hebrew-text { direction: rtl; text-align: right; font-size: 1.3em; }
+        .english-text { direction: ltr; text-align: left; font-size: 1.1em; }
+        .verse-number { font-weight: bold; color: #667eea; font-size: 0.9em; margin: 0 0.3em; }
+        """
+
+    # Query parameters for every /api/texts request
+    _SEFARIA_PARAMS = {
+        "ven": "The_Koren_Jerusalem_Bible",  # Clean English version
+        "vhe": "Tanach_with_Nikkud",  # Clean Hebrew with vowels
+        "commentary": 0,
+        "context": 1,
+        "pad": 0,
+        "wrapLinks": 0,
+        "wrapNamedEntities": 0,
+        "stripmarkers": 1,
+    }
+
     def __init__(self):
         # Optional explicit mapping mode
         self.explicit_enabled = False
@@ -80,6 +411,17 @@ class TanakhGenerator:
         # Load Chagall images configuration
         self.chagall_images = self._load_chagall_images()
 
+        # Plain filename lists per book and a filename -> image dict index, so
+        # candidate scans compare strings instead of calling dict.get per image
+        self._book_filenames = {
+            book: [im["filename"] for im in imgs] for book, imgs in self.chagall_images.items()
+        }
+        self._img_by_filename = {}
+        for im in self.all_chagall_images:
+            self._img_by_filename.setdefault(im["filename"], im)
+        # filename -> display title for the Illustration Index
+        self._title_by_fn = {fn: im.get("title") or fn for fn, im in self._img_by_filename.items()}
+
         # Load definitive per-chapter placements if available
         self.chagall_chapter_map = self._load_chagall_placements()
 
@@ -91,16 +433,38 @@ class TanakhGenerator:
         # Load optional per-book intro image overrides (ignored if explicit mode)
         self.book_intro_overrides = self._load_book_intro_overrides()
 
-        # Track how each image is used to build an Illustration Index
-        # { filename: [
-        #     { 'kind': 'intro', 'book': str },
-        #     { 'kind': 'chapter', 'book': str, 'chapter': int }
-        # ] }
-        self.image_usages = {}
+        # Track how each image is used to build an Illustration Index, split by
+        # kind: filename -> intro books in usage order, and filename ->
+        # (book, chapter) pairs kept sorted as they are recorded
+        self._intros_by_fn = defaultdict(list)
+        self._chaps_by_fn = defaultdict(list)
+        # filename -> formatted usage label, built by _build_usage_labels
+        self._label_by_fn = {}
+
+        # Per-book progress lines, printed in one write after each book
+        self._log_lines = []
+
+        # book -> Future for the per-chapter texts queued by _prefetch_texts
+        self._pending_texts = {}
+        # Revalidate cached chapters with the server instead of trusting them as-is
+        self.refresh_text = False
+
+        # One keep-alive connection pool for every Sefaria request, sized so
+        # each prefetch worker can hold its own connection
+        self.session = requests.Session()
+        self.session.mount(
+            "https://", requests.adapters.HTTPAdapter(pool_maxsize=MAX_CONCURRENT_FETCHES)
+        )
+        self._rate_limiter = _RateLimiter(MAX_REQUESTS_PER_SECOND)
 
         # Enforce unique usage of images across the EPUB
         self.used_images = set()  # set[str]
 
+        # Resolved placements, filled by _plan_images before rendering
+        self._final_intro_by_book = {}  # book -> image dict
+        self._final_image_by_chapter = {}  # (book, chapter) -> filename
+        self._images_planned = False
+
         # Map filename -> source book as defined in chagall config
         self.source_book_by_filename = {}
         for img in self.all_chagall_images:
@@ -111,6 +475,8 @@ class TanakhGenerator:
 
         # For biasing and fairness: maintain order and basic counts
         self.book_order = [b[0] for b in self.books]
+        # book -> position in reading order, for constant-time ranking
+        self._book_position = {b: i for i, b in enumerate(self.book_order)}
         self.source_book_usage_counts = {b: 0 for b in self.book_order + ["General"]}
 
         # Image mappings for user's artwork - each used once
@@ -126,7 +492,14 @@ class TanakhGenerator:
         }
 
         # Set up Jinja2 templates
-        self.template_env = Environment(loader=FileSystemLoader("templates"), autoescape=True)
+        # Templates don't change during a build, so skip Jinja's per-lookup mtime check
+        self.template_env = Environment(
+            loader=FileSystemLoader("templates"), autoescape=True, auto_reload=False
+        )
+
+        # Load CSS from template file once; fall back to inline CSS if not found
+        css_path = Path("templates/style_minimal.css")
+        self._css = css_path.read_text() if css_path.exists() else self._get_fallback_css()
 
     def _load_explicit_config(self):
         """Load explicit placements if provided in explicit_placements.json.
@@ -167,6 +540,16 @@ class TanakhGenerator:
             # Ignore malformed explicit file
             pass
 
+    def _log(self, line: str):
+        """Queue a progress line; see _flush_log"""
+        self._log_lines.append(line)
+
+    def _flush_log(self):
+        """Print queued progress lines with a single write"""
+        if self._log_lines:
+            print("\n".join(self._log_lines))
+            self._log_lines.clear()
+
     def _load_chagall_images(self) -> Dict:
         """Load Chagall images mapping from config"""
         chagall_map = {}
@@ -177,6 +560,10 @@ class TanakhGenerator:
             with open(config_path, "r") as f:
                 config = json.load(f)
 
+            # One directory scan instead of a stat() per configured image
+            image_dir = Path("images")
+            existing = {e.name for e in os.scandir(image_dir)} if image_dir.is_dir() else set()
+
             # Group images by book
             for item in config:
                 book = item["book"]
@@ -184,12 +571,11 @@ class TanakhGenerator:
                     chagall_map[book] = []
 
                 # Check if the image file actually exists
-                img_path = Path("images") / item["filename"]
-                if img_path.exists():
+                if item["filename"] in existing:
                     image_data = {
                         "filename": item["filename"],
                         "title": item["title"],
-                        "path": str(img_path),
+                        "path": str(image_dir / item["filename"]),
                         "book": book,
                     }
                     chagall_map[book].append(image_data)
@@ -215,9 +601,9 @@ class TanakhGenerator:
             if not filename:
                 raise ValueError(f"Missing explicit intro image for book: {book_name}")
             # Find the image dict for this filename
-            for img in self.all_chagall_images:
-                if img.get("filename") == filename:
-                    return img
+            img = self._img_by_filename.get(filename)
+            if img:
+                return img
             # If not a Chagall image, allow non-config images too
             img_path = Path("images") / filename
             if not img_path.exists():
@@ -230,54 +616,40 @@ class TanakhGenerator:
             }
 
         override = self.book_intro_overrides.get(book_name)
-        images = self.chagall_images.get(book_name) or []
-
-        # Helper to find first unused in a list of image dicts
-        def first_unused(img_list):
-            for im in img_list:
-                fn = im.get("filename")
-                if fn and fn not in self.used_images:
-                    return im
+        filenames = self._book_filenames.get(book_name) or []
+
+        # Helper to find first unused in a list of filenames
+        def first_unused(fn_list):
+            for fn in fn_list:
+                if fn not in self.used_images:
+                    return self._img_by_filename[fn]
             return None
 
         # Try override if available and unused
-        if override:
-            for img in images:
-                if img.get("filename") == override and img.get("filename") not in self.used_images:
-                    return img
+        if override and override in filenames and override not in self.used_images:
+            return self._img_by_filename[override]
 
         # Try first unused image for this book
-        pick = first_unused(images)
+        pick = first_unused(filenames)
         if pick:
             return pick
 
         # Fallback to "General" pool if available
-        general = self.chagall_images.get("General") or []
-        pick = first_unused(general)
+        pick = first_unused(self._book_filenames.get("General") or [])
         if pick:
             return pick
         return None
 
     def create_book_intro_page(self, book_name: str, hebrew_name: str) -> Optional[epub.EpubHtml]:
         """Create a decorative intro page for a book with a representative image."""
-        img = self._select_book_image(book_name)
+        img = self._final_intro_by_book.get(book_name)
         if not img:
             return None
 
         # Record usage as an intro image
-        self.image_usages.setdefault(img["filename"], []).append(
-            {"kind": "intro", "book": book_name}
-        )
+        self._intros_by_fn[img["filename"]].append(book_name)
         # Emit log line for intro image usage
-        print(f"    ↳ Intro image for {book_name}: {img['filename']}")
-
-        # Enforce uniqueness in explicit mode
-        if self.explicit_enabled and img["filename"] in self.used_images:
-            raise ValueError(f"Image reused across intro/chapters: {img['filename']}")
-        # Mark image as used
-        self.used_images.add(img["filename"])
-        src_bk = self.source_book_by_filename.get(img["filename"], "General")
-        self.source_book_usage_counts[src_bk] = self.source_book_usage_counts.get(src_bk, 0) + 1
+        self._log(f"    ↳ Intro image for {book_name}: {img['filename']}")
 
         page = epub.EpubHtml(
             title=f"{book_name} - Introduction",
@@ -419,87 +791,215 @@ class TanakhGenerator:
         return {}
 
     def get_css(self) -> str:
-        """Load CSS from template file"""
-        css_path = Path("templates/style_minimal.css")
-        if css_path.exists():
-            return css_path.read_text()
-        else:
-            # Fallback to inline CSS if template not found
-            return self._get_fallback_css()
+        """Return the stylesheet loaded at init"""
+        return self._css
 
     def _get_fallback_css(self) -> str:
         """Fallback CSS if template file not found"""
-        return """
-        body { font-family: Georgia, serif; line-height: 1.6; margin: 1em; }
-        .chapter-container { margin: 0 auto; padding: 1em; }
-        .hebrew-text { direction: rtl; text-align: right; font-size: 1.3em; }
-        .english-text { direction: ltr; text-align: left; font-size: 1.1em; }
-        .verse-number { font-weight: bold; color: #667eea; font-size: 0.9em; margin: 0 0.3em; }
-        """
+        return self._FALLBACK_CSS
 
     def fetch_text(self, book: str, chapter: int) -> Dict:
-        """Fetch Hebrew and English text from Sefaria API"""
-        url = f"https://www.sefaria.org/api/texts/{book}.{chapter}"
-        params = {
-            "ven": "The_Koren_Jerusalem_Bible",  # Clean English version
-            "vhe": "Tanach_with_Nikkud",  # Clean Hebrew with vowels
-            "commentary": 0,
-            "context": 1,
-            "pad": 0,
-            "wrapLinks": 0,
-            "wrapNamedEntities": 0,
-            "stripmarkers": 1,
-        }
+        """Fetch Hebrew and English text for one chapter.
+
+        Waits on the book's prefetched download when there is one; otherwise
+        the chapter is requested on its own.
+        """
+        future = self._pending_texts.get(book)
+        if future is not None:
+            chapters = future.result()
+            if chapter <= len(chapters):
+                return chapters[chapter - 1]
+        return self._download_text(book, chapter)
+
+    def _prefetch_texts(
+        self, executor: ThreadPoolExecutor, books_to_process: list, chapter_limit: Optional[int]
+    ):
+        """Queue one download per book on the executor so they overlap the page building"""
+        for english_name, _, _, chapter_count in books_to_process:
+            if chapter_limit is not None:
+                chapter_count = min(chapter_limit, chapter_count)
+            self._pending_texts[english_name] = executor.submit(
+                self._download_book, english_name, chapter_count
+            )
+
+    def _download_book(self, book: str, chapter_count: int) -> List[Dict]:
+        """Fetch chapters 1..chapter_count on the calling worker, one dict per chapter.
+
+        Chapters already in the cache cost nothing. The rest come from one
+        request for the whole range, each cached on its own so test and full
+        runs share entries; any chapter the range response can't supply is
+        requested by itself. With refresh_text every chapter is revalidated
+        with its own conditional request instead.
+        """
+        if chapter_count == 1 or self.refresh_text:
+            return [self._download_text(book, n) for n in range(1, chapter_count + 1)]
+
+        chapter_files = [self._text_cache_file(f"{book}.{n}") for n in range(1, chapter_count + 1)]
+        cached = [self._read_text_cache(f) for f in chapter_files]
+        if all(c is not None for c in cached):
+            return cached
+
+        # The range response itself is not cached; only the validated chapters are
+        data = self._download_ref(f"{book}.1-{chapter_count}", cache=False)
+        hebrew = data.get("he")
+        english = data.get("text")
+        # A spanning ref should nest one verse list per chapter. Anything else
+        # (a flat verse list, an error payload) can't be split safely
+        if (
+            data.get("isSpanning")
+            and isinstance(hebrew, list)
+            and isinstance(english, list)
+            and all(isinstance(ch, list) for ch in hebrew)
+            and all(isinstance(ch, list) for ch in english)
+        ):
+            sliced = [
+                {"he": he, "text": en} for he, en in zip_longest(hebrew, english, fillvalue=[])
+            ]
+        else:
+            print(f"  ⚠ Unusable range response for {book}; fetching its chapters one by one")
+            sliced = []
+
+        chapters = []
+        for chapter_num, (entry, cache_file) in enumerate(zip(cached, chapter_files), 1):
+            if entry is None and chapter_num <= len(sliced):
+                entry = sliced[chapter_num - 1]
+                if entry["he"] or entry["text"]:
+                    # No validators: the range's ETag doesn't describe one chapter
+                    self._write_text_cache(cache_file, orjson.dumps(entry))
+                else:
+                    entry = None
+            chapters.append(entry if entry is not None else self._download_text(book, chapter_num))
+        return chapters
+
+    def _download_text(self, book: str, chapter: int) -> Dict:
+        """Fetch a single chapter from the Sefaria API"""
+        return self._download_ref(f"{book}.{chapter}")
+
+    @classmethod
+    def _text_cache_file(cls, ref: str) -> Path:
+        """One file per ref, grouped by the text versions requested"""
+        versions = f"{cls._SEFARIA_PARAMS['ven']}__{cls._SEFARIA_PARAMS['vhe']}"
+        return TEXT_CACHE_DIR / versions / f"{ref}.json"
+
+    @staticmethod
+    def _read_text_cache(cache_file: Path) -> Optional[Dict]:
+        """Cached response body, or None if it is missing or unreadable"""
+        try:
+            return orjson.loads(cache_file.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+    def _download_ref(self, ref: str, cache: bool = True) -> Dict:
+        """Fetch Hebrew and English text for a Sefaria ref, through the on-disk cache if cache"""
+        url = f"https://www.sefaria.org/api/texts/{ref}"
+        params = self._SEFARIA_PARAMS
+
+        # The response's validators sit next to the cached body for conditional re-fetches
+        cache_file = self._text_cache_file(ref)
+        validators_file = cache_file.with_suffix(".validators.json")
+        cached = self._read_text_cache(cache_file) if cache else None
+        if cached is not None and not self.refresh_text:
+            return cached
+
+        # When revalidating, let the server answer 304 for unchanged chapters
+        headers = {}
+        if cached is not None:
+            try:
+                validators = orjson.loads(validators_file.read_bytes())
+            except (OSError, orjson.JSONDecodeError):
+                validators = {}
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
 
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = requests.get(url, params=params, timeout=30)
+                self._rate_limiter.acquire()
+                response = self.session.get(url, params=params, headers=headers, timeout=30)
+                if response.status_code == 304 and cached is not None:
+                    return cached
                 if response.status_code == 200:
-                    return response.json()
+                    data = orjson.loads(response.content)
+                    # Error payloads ({"error": ...}) come back as 200 too; only
+                    # keep real text
+                    if cache and "he" in data and "text" in data:
+                        self._write_text_cache(
+                            cache_file,
+                            response.content,
+                            {
+                                "etag": response.headers.get("ETag"),
+                                "last_modified": response.headers.get("Last-Modified"),
+                            },
+                        )
+                    return data
+                # Only pause when the server is throttling or briefly unavailable
+                if response.status_code in BACKOFF_STATUSES and attempt < max_retries - 1:
+                    time.sleep(_retry_delay(response, attempt))
             except Exception:
                 if attempt < max_retries - 1:
-                    time.sleep(2)
-        return {}
+                    time.sleep(_retry_delay(None, attempt))
+        # A failed revalidation still leaves the previously cached text usable
+        return cached if cached is not None else {}
 
-    def create_chapter_responsive(
-        self, book_name: str, hebrew_name: str, chapter_num: int, chapter_count: int
-    ) -> Optional[epub.EpubHtml]:
-        """Create a chapter with responsive Hebrew/English layout"""
-        print(f"  Chapter {chapter_num}/{chapter_count}")
+    @staticmethod
+    def _write_text_cache(cache_file: Path, body: bytes, validators: Optional[Dict] = None):
+        """Store a response body and, when given, its validators next to it.
+
+        The cache is best-effort: on a read-only checkout or a full disk the
+        fetched text is still used, and the next run downloads it again.
+        """
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            cache_file.write_bytes(body)
+            if validators is not None:
+                cache_file.with_suffix(".validators.json").write_bytes(orjson.dumps(validators))
+        except OSError:
+            pass
 
-        data = self.fetch_text(book_name, chapter_num)
+    def fetch_verses(self, book: str, chapter: int) -> Optional[ChapterText]:
+        """Fetch a chapter and return its cleaned verses, or None if the text is missing"""
+        data = self.fetch_text(book, chapter)
         if not data or "he" not in data or "text" not in data:
             return None
 
         hebrew_text = data["he"]
         english_text = data["text"]
 
+        # A single-verse chapter may come back as a bare string
         if isinstance(hebrew_text, str):
             hebrew_text = [hebrew_text]
         if isinstance(english_text, str):
             english_text = [english_text]
 
-        # Clean and filter verses
-        hebrew_verses = []
-        for v in hebrew_text:
-            if v:
-                clean_v = re.sub(r"<[^>]+>", "", v)
-                clean_v = re.sub(r"\s+", " ", clean_v)
-                clean_v = clean_v.strip()
-                if clean_v:
-                    hebrew_verses.append(clean_v)
-
-        english_verses = []
-        for v in english_text:
-            if v:
-                clean_v = re.sub(r"<[^>]+>", "", v)
-                clean_v = re.sub(r"\s+", " ", clean_v)
-                clean_v = clean_v.strip()
-                if clean_v:
-                    english_verses.append(clean_v)
-
-        # Check for image
+        return ChapterText(self._clean_verses(hebrew_text), self._clean_verses(english_text))
+
+    @staticmethod
+    def _clean_verses(items) -> list:
+        """Strip leftover HTML tags, normalize whitespace and drop empty verses.
+
+        A verse Sefaria returns as a list of fragments is joined into one string.
+        Entity references are decoded, since the page builder escapes the text.
+        """
+        flat = (" ".join(v) if isinstance(v, list) else v for v in items if v)
+        # split()/join collapses and trims whitespace in one pass, without a regex;
+        # unescaping afterwards keeps &nbsp; a non-breaking space, as in the markup
+        cleaned = (unescape(" ".join(_TAG_RE.sub("", v).split())) for v in flat)
+        return [v for v in cleaned if v]
+
+    def _mark_image_used(self, filename: str):
+        """Reserve an image and bump the usage count of its source book."""
+        self.used_images.add(filename)
+        src_bk = self.source_book_by_filename.get(filename, "General")
+        self.source_book_usage_counts[src_bk] = self.source_book_usage_counts.get(src_bk, 0) + 1
+
+    def _resolve_chapter_image(self, book_name: str, chapter_num: int) -> Optional[str]:
+        """Pick the image for a chapter, honoring the placement priority.
+
+        Order: explicit map (explicit mode only), original artwork map, balanced
+        schedule, then the best unused definitive Chagall placement.
+        """
         image_file = None
         if self.explicit_enabled:
             image_file = self.explicit_chapter_map.get((book_name, chapter_num))
@@ -531,11 +1031,7 @@ class TanakhGenerator:
                 src = self.source_book_by_filename.get(fn, "General")
                 prefer = 0 if src == book_name else 1
                 usage = self.source_book_usage_counts.get(src, 0)
-                order = (
-                    self.book_order.index(src)
-                    if src in self.book_order
-                    else len(self.book_order) + 1
-                )
+                order = self._book_position.get(src, len(self.book_order) + 1)
                 return (prefer, usage, order, fn)
 
             unused.sort(key=score)
@@ -550,17 +1046,56 @@ class TanakhGenerator:
         if not image_file and not self.explicit_enabled:
             image_file = pick_candidate_for_chapter(book_name, chapter_num)
 
+        return image_file
+
+    def _plan_images(self, books_to_process: list, chapter_limit: Optional[int] = None):
+        """Resolve every intro and chapter image before rendering.
+
+        Walks books in reading order, choosing the intro image and then each
+        chapter's image, so uniqueness is settled once and deterministically.
+        Fills self._final_intro_by_book and self._final_image_by_chapter.
+        """
+        self._final_intro_by_book = {}
+        self._final_image_by_chapter = {}
+        for english_name, _hebrew_name, _transliteration, chapter_count in books_to_process:
+            if chapter_limit is not None:
+                chapter_count = min(chapter_limit, chapter_count)
+
+            img = self._select_book_image(english_name)
+            if img:
+                # Enforce uniqueness in explicit mode
+                if self.explicit_enabled and img["filename"] in self.used_images:
+                    raise ValueError(f"Image reused across intro/chapters: {img['filename']}")
+                self._mark_image_used(img["filename"])
+                self._final_intro_by_book[english_name] = img
+
+            for chapter_num in range(1, chapter_count + 1):
+                image_file = self._resolve_chapter_image(english_name, chapter_num)
+                if image_file:
+                    self._mark_image_used(image_file)
+                    self._final_image_by_chapter[(english_name, chapter_num)] = image_file
+        self._images_planned = True
+
+    def create_chapter_responsive(
+        self, book_name: str, hebrew_name: str, chapter_num: int, chapter_count: int
+    ) -> Optional[epub.EpubHtml]:
+        """Create a chapter with responsive Hebrew/English layout"""
+        self._log(f"  Chapter {chapter_num}/{chapter_count}")
+
+        text = self.fetch_verses(book_name, chapter_num)
+        if text is None:
+            self._log(f"    ⚠ No text fetched for {book_name} {chapter_num}; chapter skipped")
+            return None
+        hebrew_verses, english_verses = text
+
+        # Image placement is resolved up-front by _plan_images
+        image_file = self._final_image_by_chapter.get((book_name, chapter_num))
+
         # Record usage as chapter image if present
         if image_file:
-            self.image_usages.setdefault(image_file, []).append(
-                {"kind": "chapter", "book": book_name, "chapter": chapter_num}
-            )
+            insort(self._chaps_by_fn[image_file], (book_name, chapter_num))
             # Emit log line for chapter image usage
-            print(f"    ↳ Chapter image: {book_name} {chapter_num} -> {image_file}")
-            # Mark used and update counts
-            self.used_images.add(image_file)
-            src_bk = self.source_book_by_filename.get(image_file, "General")
-            self.source_book_usage_counts[src_bk] = self.source_book_usage_counts.get(src_bk, 0) + 1
+            self._log(f"    ↳ Chapter image: {book_name} {chapter_num} -> {image_file}")
 
         # Create chapter
         chapter = epub.EpubHtml(
@@ -570,49 +1105,45 @@ class TanakhGenerator:
         )
 
         # Build HTML with responsive layout
-        html = f"""<!DOCTYPE html>
-<html xmlns="http://www.w3.org/1999/xhtml">
-<head>
-    <title>{book_name} {chapter_num}</title>
-    <link rel="stylesheet" type="text/css" href="style.css"/>
-</head>
-<body>
-    <div class="chapter-container">
-        <div class="chapter-header">
-            <h1>{book_name} {chapter_num}</h1>
-            <h2>{hebrew_name} פרק {self.to_hebrew_numeral(chapter_num)}</h2>
-        </div>"""
+        header = self._chapter_heading("chapter-header", book_name, hebrew_name, chapter_num)
+        container = E.div({"class": "chapter-container"}, header)
 
         if image_file:
-            html += f"""
-        <div class="chapter-image">
-            <img src="images/{image_file}" alt="{book_name} Chapter {chapter_num}"/>
-            <div class="image-caption">{book_name} Chapter {chapter_num}</div>
-        </div>"""
-
-        html += """
-        <div class="verses-container">"""
+            container.append(
+                self._chapter_figure("chapter-image", book_name, chapter_num, image_file)
+            )
 
         # Add verses - simple, no wrapper
-        max_verses = max(len(hebrew_verses), len(english_verses))
-        for i in range(max_verses):
-            if i < len(hebrew_verses):
-                html += f"""
-            <div class="hebrew-verse">
-                <span class="verse-number">{i + 1}</span>{hebrew_verses[i]}
-            </div>"""
-
-            if i < len(english_verses):
-                html += f"""
-            <div class="english-verse">
-                <span class="verse-number">{i + 1}</span>{english_verses[i]}
-            </div>"""
-
-        html += """
-        </div>
-    </div>
-</body>
-</html>"""
+        # Rows are collected in a list and attached to the container in one go
+        rows = []
+        for num, (hebrew, english) in enumerate(zip_longest(hebrew_verses, english_verses), 1):
+            label = str(num)
+            if hebrew is not None:
+                rows.append(
+                    E.div(
+                        {"class": "hebrew-verse"},
+                        E.span({"class": "verse-number"}, label),
+                        hebrew,
+                    )
+                )
+            if english is not None:
+                rows.append(
+                    E.div(
+                        {"class": "english-verse"},
+                        E.span({"class": "verse-number"}, label),
+                        english,
+                    )
+                )
+        container.append(E.div({"class": "verses-container"}, *rows))
+
+        root = E.html(
+            E.head(
+                E.title(f"{book_name} {chapter_num}"),
+                E.link(rel="stylesheet", type="text/css", href="style.css"),
+            ),
+            E.body(container),
+        )
+        html = "<!DOCTYPE html>\n" + etree.tostring(root, method="xml", encoding="unicode")
 
         chapter.content = html
         return chapter
@@ -623,38 +1154,10 @@ class TanakhGenerator:
         """Create a chapter with Hebrew/English text and optional images"""
         print(f"  Chapter {chapter_num}/{chapter_count}")
 
-        data = self.fetch_text(book_name, chapter_num)
-        if not data or "he" not in data or "text" not in data:
+        text = self.fetch_verses(book_name, chapter_num)
+        if text is None:
             return None
-
-        hebrew_text = data["he"]
-        english_text = data["text"]
-
-        if isinstance(hebrew_text, str):
-            hebrew_text = [hebrew_text]
-        if isinstance(english_text, str):
-            english_text = [english_text]
-
-        # Clean and filter verses (minimal cleaning needed with clean API versions)
-        hebrew_verses = []
-        for v in hebrew_text:
-            if v:
-                # Just in case there are any remaining HTML artifacts
-                clean_v = re.sub(r"<[^>]+>", "", v)  # Remove any HTML tags
-                clean_v = re.sub(r"\s+", " ", clean_v)  # Normalize whitespace
-                clean_v = clean_v.strip()
-                if clean_v:  # Only add non-empty verses
-                    hebrew_verses.append(clean_v)
-
-        english_verses = []
-        for v in english_text:
-            if v:
-                # Just in case there are any remaining HTML artifacts
-                clean_v = re.sub(r"<[^>]+>", "", v)  # Remove any HTML tags
-                clean_v = re.sub(r"\s+", " ", clean_v)  # Normalize whitespace
-                clean_v = clean_v.strip()
-                if clean_v:  # Only add non-empty verses
-                    english_verses.append(clean_v)
+        hebrew_verses, english_verses = text
 
         # Create chapter
         chapter = epub.EpubHtml(
@@ -663,10 +1166,14 @@ class TanakhGenerator:
             lang="he",
         )
 
-        # Check for image - first try original artwork, then definitive Chagall placement
-        image_file = self.image_map.get((book_name, chapter_num)) or (
-            self.chagall_chapter_map.get((book_name, chapter_num), [None])[0]
-        )
+        # Image placement is resolved up-front by _plan_images; without a plan
+        # (called outside generate), use original artwork, then the first
+        # definitive Chagall placement
+        key = (book_name, chapter_num)
+        if self._images_planned:
+            image_file = self._final_image_by_chapter.get(key)
+        else:
+            image_file = self.image_map.get(key) or (self.chagall_chapter_map.get(key) or [None])[0]
 
         # Try to use template
         try:
@@ -689,6 +1196,24 @@ class TanakhGenerator:
         chapter.content = html_content
         return chapter
 
+    def _chapter_heading(self, css_class: str, book_name: str, hebrew_name: str, chapter_num: int):
+        """English and Hebrew chapter titles, shared by both chapter layouts"""
+        return E.div(
+            {"class": css_class},
+            E.h1(f"{book_name} {chapter_num}"),
+            E.h2(f"{hebrew_name} פרק {self.to_hebrew_numeral(chapter_num)}"),
+        )
+
+    @staticmethod
+    def _chapter_figure(css_class: str, book_name: str, chapter_num: int, image_file: str):
+        """Chapter illustration with its caption, shared by both chapter layouts"""
+        caption = f"{book_name} Chapter {chapter_num}"
+        return E.div(
+            {"class": css_class},
+            E.img(src=f"images/{image_file}", alt=caption),
+            E.div({"class": "image-caption"}, caption),
+        )
+
     def _create_fallback_html(
         self,
         book_name: str,
@@ -699,158 +1224,144 @@ class TanakhGenerator:
         english_verses: list,
     ) -> str:
         """Fallback HTML generation if template not found"""
-        html = f"""
-        <div class="chapter-container">
-            <div class="header-section">
-                <h1>{book_name} {chapter_num}</h1>
-                <h2>{hebrew_name} פרק {self.to_hebrew_numeral(chapter_num)}</h2>
-            </div>
-        """
+        container = E.div(
+            {"class": "chapter-container"},
+            self._chapter_heading("header-section", book_name, hebrew_name, chapter_num),
+        )
 
         if image_file:
-            html += f"""
-            <div class="image-container">
-                <img src="images/{image_file}" alt="{book_name} Chapter {chapter_num}"/>
-                <div class="image-caption">{book_name} Chapter {chapter_num}</div>
-            </div>
-            """
-
-        html += '<div class="content-layout">'
-
-        # Hebrew section
-        html += '<div class="text-section hebrew-section"><div class="hebrew-text">'
-        for i, verse in enumerate(hebrew_verses, 1):
-            html += f'<span class="verse-number">{i}</span>{verse} '
-        html += "</div></div>"
-
-        # English section
-        html += '<div class="text-section english-section"><div class="english-text">'
-        for i, verse in enumerate(english_verses, 1):
-            html += f'<span class="verse-number">{i}</span>{verse} '
-        html += "</div></div>"
+            container.append(
+                self._chapter_figure("image-container", book_name, chapter_num, image_file)
+            )
 
-        html += "</div></div>"
-        return html
+        def numbered(text_class: str, verses: list):
+            text = E.div({"class": text_class})
+            for i, verse in enumerate(verses, 1):
+                num = E.span({"class": "verse-number"}, str(i))
+                num.tail = f"{verse} "
+                text.append(num)
+            return text
+
+        container.append(
+            E.div(
+                {"class": "content-layout"},
+                # Hebrew section
+                E.div(
+                    {"class": "text-section hebrew-section"}, numbered("hebrew-text", hebrew_verses)
+                ),
+                # English section
+                E.div(
+                    {"class": "text-section english-section"},
+                    numbered("english-text", english_verses),
+                ),
+            )
+        )
+        return etree.tostring(container, method="xml", encoding="unicode")
 
     def to_hebrew_numeral(self, num: int) -> str:
         """Convert number to Hebrew numeral"""
-        ones = ["", "א", "ב", "ג", "ד", "ה", "ו", "ז", "ח", "ט"]
-        tens = ["", "י", "כ", "ל", "מ", "נ", "ס", "ע", "פ", "צ"]
-        hundreds = ["", "ק", "ר", "ש", "ת"]
-
-        if num >= 1000:
-            return str(num)
-
-        result = ""
-        if num >= 100:
-            result += hundreds[num // 100]
-            num %= 100
-        if num >= 10:
-            result += tens[num // 10]
-            num %= 10
-        if num > 0:
-            result += ones[num]
-
-        if len(result) > 1:
-            result = result[:-1] + "״" + result[-1:]
-        elif len(result) == 1:
-            result = result + "׳"
-
-        return result
+        if 0 <= num < len(_HEBREW_NUMERALS):
+            return _HEBREW_NUMERALS[num]
+        return _hebrew_numeral(num)
 
     def _image_title_for_filename(self, filename: str) -> str:
         """Best-effort human title for an image filename.
         Prefer title from Chagall config; otherwise derive from filename.
         """
-        # Try from loaded Chagall config
-        for img in self.all_chagall_images:
-            if img.get("filename") == filename:
-                return img.get("title") or filename
-        # Derive from filename
+        # Try from loaded Chagall config (or a title derived on an earlier call)
+        title = self._title_by_fn.get(filename)
+        if title:
+            return title
+        # Derive from filename and remember it
         stem = Path(filename).stem
-        return stem.replace("_", " ").replace("-", " ").strip().title() or filename
+        title = stem.replace("_", " ").replace("-", " ").strip().title() or filename
+        self._title_by_fn[filename] = title
+        return title
 
     def _usage_label(self, filename: str) -> str:
         """Create a concise label describing how an image is used."""
-        usages = self.image_usages.get(filename, [])
-        if not usages:
-            return "Gallery / Unused"
-
-        parts = []
-        # Prefer stable ordering: intro first, then chapters by book/chapter
-        intro_parts = [u for u in usages if u.get("kind") == "intro"]
-        chap_parts = [u for u in usages if u.get("kind") == "chapter"]
-        for u in intro_parts:
-            parts.append(f"Book Intro — {u['book']}")
-        for u in sorted(chap_parts, key=lambda x: (x.get("book", ""), x.get("chapter", 0))):
-            parts.append(f"Chapter — {u['book']} {u['chapter']}")
-        return "; ".join(parts) if parts else "Gallery / Unused"
-
-    def _build_illustration_pages(self, book: epub.EpubBook, css: epub.EpubItem):
+        return self._label_by_fn.get(filename) or "Gallery / Unused"
+
+    def _build_usage_labels(self):
+        """Format the usage label of every used image in one pass."""
+        self._label_by_fn = {}
+        for filename in self._intros_by_fn.keys() | self._chaps_by_fn.keys():
+            # Stable ordering: intro first, then chapters by book/chapter
+            parts = [f"Book Intro — {bk}" for bk in self._intros_by_fn.get(filename, ())]
+            parts += [f"Chapter — {bk} {ch}" for bk, ch in self._chaps_by_fn.get(filename, ())]
+            self._label_by_fn[filename] = "; ".join(parts)
+
+    def _scan_images(self) -> list:
+        """List the JPEG files in images/ as os.DirEntry objects, sorted by name"""
+        image_dir = "images"
+        if not os.path.isdir(image_dir):
+            return []
+        with os.scandir(image_dir) as it:
+            entries = [e for e in it if e.name.lower().endswith((".jpg", ".jpeg")) and e.is_file()]
+        entries.sort(key=lambda e: e.name.lower())
+        return entries
+
+    def _build_illustration_pages(self, book: epub.EpubBook, image_entries: list):
         """Create a page per image and return (toc_section, pages_list).
         Adds pages to the book and returns an epub.Section and list of page items.
         """
-        image_dir = Path("images")
-        if not image_dir.exists():
+        # One page per JPEG image that was embedded
+        if not image_entries:
             return None, []
 
-        # Enumerate all JPEG images that were embedded
-        all_images = sorted(
-            list(image_dir.glob("*.jpg")) + list(image_dir.glob("*.jpeg")),
-            key=lambda p: p.name.lower(),
-        )
+        self._build_usage_labels()
+        # Compiled once; each page only renders title, usage and filename
+        template = self.template_env.get_template("illustration.html")
 
         pages = []
-        for img_path in all_images:
-            filename = img_path.name
+        for entry in image_entries:
+            filename = entry.name
             title_text = self._image_title_for_filename(filename)
             usage_text = self._usage_label(filename)
 
             page = epub.EpubHtml(
                 title=f"Illustration — {title_text}",
-                file_name=f"img_{img_path.stem}.xhtml",
+                file_name=f"img_{os.path.splitext(filename)[0]}.xhtml",
                 lang="en",
             )
-            page_html = f"""
-            <!DOCTYPE html>
-            <html xmlns=\"http://www.w3.org/1999/xhtml\">
-            <head>
-                <title>Illustration — {title_text}</title>
-                <link rel=\"stylesheet\" type=\"text/css\" href=\"style.css\"/>
-                <style>
-                    .illustration-page {{ text-align:center; margin: 8% auto 5%; }}
-                    .illustration-page h1 {{ font-size: 1.3em; margin: 0.2em 0; }}
-                    .illustration-page .usage {{ font-size: 0.95em; color:#666;
-                                              margin: 0.4em 0 0.8em; }}
-                    .illustration-page img {{ max-width: 92%; height:auto; }}
-                    .illustration-page .caption {{ font-size: 0.9em; color:#555;
-                                                margin-top: 0.6em; }}
-                </style>
-            </head>
-            <body>
-                <div class=\"illustration-page\">
-                    <h1>{title_text}</h1>
-                    <div class=\"usage\">{usage_text}</div>
-                    <img src=\"images/{filename}\" alt=\"{title_text}\"/>
-                    <div class=\"caption\">{title_text}</div>
-                </div>
-            </body>
-            </html>
-            """
+            # Escape once up front; Markup values are not re-escaped by autoescape,
+            # which would otherwise run for each of the four title placements
+            page_html = template.render(
+                title=escape(title_text), usage=escape(usage_text), filename=filename
+            )
             page.content = page_html
-            page.add_item(css)
-            book.add_item(page)
             pages.append(page)
 
+        # Register the finished pages with the book in one pass
+        for page in pages:
+            book.add_item(page)
+
         if pages:
             section = epub.Section("Illustration Index")
             return section, pages
         return None, []
 
     def generate(
-        self, output_file: str = "tanakh.epub", test_mode: bool = False, test2_mode: bool = False
+        self,
+        output_file: str = "tanakh.epub",
+        test_mode: bool = False,
+        test2_mode: bool = False,
+        refresh_text: bool = False,
+        max_books: Optional[int] = None,
+        max_chapters: Optional[int] = None,
     ):
-        """Generate the complete Tanakh EPUB"""
+        """Generate the complete Tanakh EPUB.
+
+        max_books / max_chapters limit the run to the first N books and the
+        first N chapters of each; --test and --test2 are presets of these, so
+        they cannot be combined with explicit limits.
+        """
+        for name, value in (("max_books", max_books), ("max_chapters", max_chapters)):
+            if value is not None and value < 1:
+                raise ValueError(f"{name} must be a positive integer, got {value}")
+        if (test_mode or test2_mode) and (max_books is not None or max_chapters is not None):
+            raise ValueError("test modes set their own limits; drop max_books/max_chapters")
+        self.refresh_text = refresh_text
         print("=" * 60)
         print("Tanakh EPUB Generator for Kobo Libra Colour")
         print("=" * 60)
@@ -865,8 +1376,7 @@ class TanakhGenerator:
         # Add cover image
         cover_path = Path("images/chagall_moses_tablets_cover.jpg")
         if cover_path.exists():
-            with open(cover_path, "rb") as f:
-                book.set_cover("cover.jpg", f.read())
+            book.set_cover("cover.jpg", _map_file(cover_path))
             print("  ✓ Added cover image")
 
         # Add CSS
@@ -878,155 +1388,62 @@ class TanakhGenerator:
         # Embed Hebrew font
         font_path = Path("NotoSerifHebrew-Regular.ttf")
         if font_path.exists():
-            with open(font_path, "rb") as f:
-                font_item = epub.EpubItem(
-                    uid="hebrew-font",
-                    file_name="fonts/NotoSerifHebrew-Regular.ttf",
-                    media_type="application/x-font-ttf",
-                    content=f.read(),
-                )
-                book.add_item(font_item)
-                print("  ✓ Embedded Hebrew font")
+            font_item = epub.EpubItem(
+                uid="hebrew-font",
+                file_name="fonts/NotoSerifHebrew-Regular.ttf",
+                media_type="application/x-font-ttf",
+                content=_map_file(font_path),
+            )
+            book.add_item(font_item)
+            print("  ✓ Embedded Hebrew font")
 
         # Embed images
-        image_dir = Path("images")
-        if image_dir.exists():
-            images = list(image_dir.glob("*.jpg")) + list(image_dir.glob("*.jpeg"))
-            for img_path in images:
-                with open(img_path, "rb") as f:
-                    img = Image.open(f)
-                    output = io.BytesIO()
-                    img.save(output, format="JPEG", quality=85, optimize=True)
-
-                    img_item = epub.EpubImage(
-                        uid=f"img-{img_path.stem}",
-                        file_name=f"images/{img_path.name}",
-                        media_type="image/jpeg",
-                        content=output.getvalue(),
-                    )
-                    book.add_item(img_item)
+        # Scanned once; the same list drives the Illustration Index later. The
+        # cover is already packed as cover.jpg by set_cover, so leave it out
+        images = [e for e in self._scan_images() if e.name != cover_path.name]
+        if images:
+            contents = {}
+            to_reencode = []
+            for entry in images:
+                raw = _map_file(entry.path)
+                # Compact, well-formed JPEGs are embedded as-is; only oversized,
+                # unreadable or non-JPEG files go through a decode + re-encode
+                if len(raw) <= MAX_PASSTHROUGH_JPEG_BYTES and _jpeg_size(raw):
+                    contents[entry.name] = raw
+                else:
+                    to_reencode.append(entry)
+
+            # Re-encoding is CPU-bound and independent per image, so spread it
+            # over worker processes; items are still added on this thread
+            if to_reencode:
+                with ProcessPoolExecutor() as executor:
+                    paths = [e.path for e in to_reencode]
+                    for entry, data in zip(to_reencode, executor.map(_reencode_jpeg, paths)):
+                        contents[entry.name] = data
+
+            for entry in images:
+                img_item = epub.EpubImage(
+                    uid=f"img-{os.path.splitext(entry.name)[0]}",
+                    file_name=f"images/{entry.name}",
+                    media_type="image/jpeg",
+                    content=contents[entry.name],
+                )
+                book.add_item(img_item)
                 # Emit log line for embedded image asset
-                print(f"  • Embedded image asset: {img_path.name}")
+                print(f"  • Embedded image asset: {entry.name}")
             print(f"  ✓ Embedded {len(images)} illustrations\n")
 
         # Create dedication page
-        dedication_html = """
-        <!DOCTYPE html>
-        <html xmlns="http://www.w3.org/1999/xhtml">
-        <head>
-            <title>Dedication</title>
-            <link rel="stylesheet" type="text/css" href="style.css"/>
-            <style>
-                .dedication {
-                    margin: 30% auto;
-                    text-align: center;
-                    font-style: italic;
-                    max-width: 80%;
-                }
-                .dedication h2 {
-                    font-size: 1.5em;
-                    margin-bottom: 1em;
-                    font-weight: normal;
-                }
-                .dedication p {
-                    font-size: 1.1em;
-                    line-height: 1.8;
-                    margin: 0.5em 0;
-                }
-                .dedication .name {
-                    font-size: 1.2em;
-                    margin-top: 2em;
-                    font-weight: bold;
-                }
-                .dedication .link {
-                    font-size: 0.9em;
-                    margin-top: 1em;
-                    color: #667eea;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="dedication">
-                <h2>Dedication</h2>
-                <p>This edition of the Tanakh is dedicated with love to</p>
-                <p class="name">Bruno "DaVenzia" Naphtali</p>
-                <p>He saved my life</p>
-                <p class="link">
-                    <a href="https://www.instagram.com/brunodavenzia/">@brunodavenzia</a>
-                </p>
-            </div>
-        </body>
-        </html>
-        """
-
         dedication = epub.EpubHtml(title="Dedication", file_name="dedication.xhtml", lang="en")
-        dedication.content = dedication_html
-        dedication.add_item(css)
+        dedication.content = _DEDICATION_HTML
         book.add_item(dedication)
 
         # Add Chagall attribution page if we have Chagall images
         if self.chagall_images:
-            attribution_html = """
-            <!DOCTYPE html>
-            <html xmlns="http://www.w3.org/1999/xhtml">
-            <head>
-                <title>Artwork Attribution</title>
-                <link rel="stylesheet" type="text/css" href="style.css"/>
-                <style>
-                    .attribution {
-                        margin: 20% auto;
-                        text-align: center;
-                        max-width: 80%;
-                    }
-                    .attribution h2 {
-                        font-size: 1.4em;
-                        margin-bottom: 1em;
-                    }
-                    .attribution p {
-                        font-size: 1em;
-                        line-height: 1.6;
-                        margin: 0.5em 0;
-                    }
-                    .attribution .artist {
-                        font-weight: bold;
-                        font-size: 1.1em;
-                        margin: 1em 0;
-                    }
-                    .attribution .source {
-                        font-style: italic;
-                        color: #667eea;
-                        margin-top: 1.5em;
-                    }
-                    .attribution a {
-                        color: #667eea;
-                        text-decoration: none;
-                    }
-                </style>
-            </head>
-            <body>
-                <div class="attribution">
-                    <h2>Artwork Attribution</h2>
-                    <p class="artist">Marc Chagall Bible Illustrations</p>
-                    <p>This edition includes beautiful Bible illustrations by Marc Chagall,</p>
-                    <p>one of the most celebrated artists of the 20th century.</p>
-                    <p>His unique vision brings the ancient texts to life with</p>
-                    <p>vibrant colors and dreamlike imagery.</p>
-                    <p class="source">
-                        Images courtesy of artchive.com<br/>
-                        <a href="https://www.artchive.com/?s=chagall+bible">
-                            www.artchive.com/?s=chagall+bible
-                        </a>
-                    </p>
-                </div>
-            </body>
-            </html>
-            """
-
             attribution = epub.EpubHtml(
                 title="Artwork Attribution", file_name="attribution.xhtml", lang="en"
             )
-            attribution.content = attribution_html
-            attribution.add_item(css)
+            attribution.content = _ATTRIBUTION_HTML
             book.add_item(attribution)
 
         # Process books
@@ -1039,50 +1456,77 @@ class TanakhGenerator:
             toc.append(attribution)
 
         # Determine which books to process
-        books_to_process = self.books
         if test2_mode:
             # test2 mode: only first 3 books, first 3 chapters each
-            books_to_process = self.books[:3]
+            max_books, max_chapters = 3, 3
             print("🧪 TEST2 MODE: Processing only first 3 books (Genesis, Exodus, Leviticus)")
             print("              with first 3 chapters each\n")
+        elif test_mode:
+            max_chapters = 3
+        elif max_books is not None or max_chapters is not None:
+            print(
+                f"🧪 Limited run: first {len(self.books[:max_books])} books, "
+                f"{'all' if max_chapters is None else max_chapters} chapters each\n"
+            )
+        books_to_process = self.books[:max_books]
+        chapter_limit = max_chapters
 
-        for book_info in books_to_process:
-            english_name, hebrew_name, transliteration, chapter_count = book_info
+        # Settle every intro/chapter image before fetching any text
+        self._plan_images(books_to_process, chapter_limit)
 
-            # Test mode - only first 3 chapters
-            if test_mode or test2_mode:
-                chapter_count = min(3, chapter_count)
+        # Book downloads are network-bound, so keep several in flight while
+        # pages are built in order; fetch_text waits on each as it is reached
+        fetcher = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES)
+        try:
+            self._prefetch_texts(fetcher, books_to_process, chapter_limit)
 
-            print(f"📖 Processing {english_name}...")
+            for book_info in books_to_process:
+                english_name, hebrew_name, transliteration, chapter_count = book_info
 
-            book_chapters = []
+                if chapter_limit is not None:
+                    chapter_count = min(chapter_limit, chapter_count)
 
-            # Add a book intro page (if we have an associated image)
-            intro_page = self.create_book_intro_page(english_name, hebrew_name)
-            if intro_page:
-                intro_page.add_item(css)
-                book.add_item(intro_page)
-                spine.append(intro_page)
-                book_chapters.append(intro_page)
-            for chapter_num in range(1, chapter_count + 1):
-                chapter = self.create_chapter_responsive(
-                    english_name, hebrew_name, chapter_num, chapter_count
-                )
-                if chapter:
-                    chapter.add_item(css)
-                    book.add_item(chapter)
-                    spine.append(chapter)
-                    book_chapters.append(chapter)
+                print(f"📖 Processing {english_name}...")
+
+                book_chapters = []
+
+                # Add a book intro page (if we have an associated image)
+                intro_page = self.create_book_intro_page(english_name, hebrew_name)
+                if intro_page:
+                    book.add_item(intro_page)
+                    book_chapters.append(intro_page)
+                for chapter_num in range(1, chapter_count + 1):
+                    chapter = self.create_chapter_responsive(
+                        english_name, hebrew_name, chapter_num, chapter_count
+                    )
+                    if chapter:
+                        book.add_item(chapter)
+                        book_chapters.append(chapter)
 
-            if book_chapters:
-                toc.append((epub.Section(f"{english_name} - {hebrew_name}"), book_chapters))
+                self._flush_log()
+
+                if book_chapters:
+                    # The book's pages join the spine in one extend
+                    spine.extend(book_chapters)
+                    toc.append((epub.Section(f"{english_name} - {hebrew_name}"), book_chapters))
+        finally:
+            # On an error, drop the queued downloads instead of waiting for them
+            fetcher.shutdown(cancel_futures=True)
+            self._pending_texts.clear()
 
         # After processing all books/chapters, build per-image pages and add to TOC
-        illus_section, illus_pages = self._build_illustration_pages(book, css)
+        illus_section, illus_pages = self._build_illustration_pages(book, images)
         if illus_pages:
             toc.append((illus_section, illus_pages))
             spine.extend(illus_pages)
 
+        # Link the shared stylesheet from every content page in one pass. ebooklib
+        # rebuilds each page's <head> from these links and drops the <link> in
+        # the markup, so the book-level item alone would leave pages unstyled
+        for page in spine:
+            if isinstance(page, epub.EpubHtml):
+                page.add_item(css)
+
         # Set navigation
         book.toc = toc
         book.spine = spine
@@ -1091,10 +1535,27 @@ class TanakhGenerator:
 
         # Write EPUB
         print(f"\n📝 Writing to {output_file}...")
-        epub.write_epub(output_file, book, {})
+        # Stream the archive to disk through a large write buffer: members are
+        # flushed in big chunks as they are added, without also holding a copy
+        # of the whole compressed book in memory
+        with open(output_file, "wb", buffering=EPUB_WRITE_BUFFER_BYTES) as out:
+            writer = _EpubWriter(out, book, {})
+            writer.process()
+            writer.write()
         print(f"✅ Generated: {output_file}\n")
 
 
+def _positive_int(value: str) -> int:
+    """argparse type for the run limits: a whole number of at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value!r}")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate Tanakh EPUB for Kobo")
     parser.add_argument("-o", "--output", default="tanakh.epub", help="Output filename")
@@ -1102,11 +1563,34 @@ def main():
     parser.add_argument(
         "--test2", action="store_true", help="Test2 mode - only first 3 books, 3 chapters each"
     )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Re-check cached Sefaria text with the server (conditional requests)",
+    )
+    parser.add_argument(
+        "--max-books", type=_positive_int, default=None, help="Only process the first N books"
+    )
+    parser.add_argument(
+        "--max-chapters",
+        type=_positive_int,
+        default=None,
+        help="Only process the first N chapters per book",
+    )
 
     args = parser.parse_args()
+    if (args.test or args.test2) and (args.max_books is not None or args.max_chapters is not None):
+        parser.error("--test/--test2 set their own limits; drop --max-books/--max-chapters")
 
     generator = TanakhGenerator()
-    generator.generate(args.output, args.test, args.test2)
+    generator.generate(
+        args.output,
+        args.test,
+        args.test2,
+        args.refresh,
+        max_books=args.max_books,
+        max_chapters=args.max_chapters,
+    )
 
 
 if __name__ == "__main__":
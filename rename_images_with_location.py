@@ -16,6 +16,7 @@ Run with --apply to perform changes; otherwise prints a dry-run plan.
 from __future__ import annotations
 import argparse
 import json
+import os
 from pathlib import Path
 import shutil
 
@@ -26,6 +27,13 @@ def load_json(path: Path):
     return json.loads(path.read_text())
 
 
+def save_json(path: Path, obj) -> None:
+    # Swap in a fully written temp file so a crash mid-write can't truncate the JSON
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(obj, indent=2))
+    os.replace(tmp, path)
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--apply", action="store_true", help="Perform file renames and update JSONs")
@@ -96,7 +104,7 @@ def main():
         if fn in name_map:
             item["filename"] = name_map[fn]
             changed += 1
-    cfg_path.write_text(json.dumps(config, indent=2))
+    save_json(cfg_path, config)
     print(f"Updated chagall_download_config.json entries: {changed}")
 
     # Update placement map keys
@@ -104,7 +112,7 @@ def main():
     for fn, refs in placement.items():
         new_fn = name_map.get(fn, fn)
         new_placement[new_fn] = refs
-    map_path.write_text(json.dumps(new_placement, indent=2))
+    save_json(map_path, new_placement)
     print("Updated chagall_placement_map.json keys")
 
 
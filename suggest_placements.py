@@ -30,6 +30,7 @@ import argparse
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import orjson
 import requests
 from dotenv import load_dotenv
 
@@ -158,22 +159,25 @@ def roman_to_int(s: str) -> Optional[int]:
     return total or None
 
 
+# Lowercased, space-separated name -> canonical book, built once. Aliases take
+# precedence over exact canonical names, which take precedence over the
+# partial fallbacks (e.g., "samuel" when a filename lacks I/II)
+_BOOK_LOOKUP: Dict[str, str] = {
+    "samuel": "I_Samuel",
+    "kings": "I_Kings",
+    "chronicles": "I_Chronicles",
+    **{b.lower().replace("_", " "): b for b in BOOKS},
+    **NAME_ALIASES,
+}
+
+
 def normalize_book_token(tok: str) -> Optional[str]:
-    t = tok.strip().replace("_", " ").lower()
-    if t in NAME_ALIASES:
-        return NAME_ALIASES[t]
-    # Exact canonical match
-    for b in BOOKS:
-        if t == b.lower().replace("_", " "):
-            return b
-    # Partial fallback (e.g., "samuel" when filename lacks I/II)
-    if t == "samuel":
-        return "I_Samuel"
-    if t == "kings":
-        return "I_Kings"
-    if t == "chronicles":
-        return "I_Chronicles"
-    return None
+    return _BOOK_LOOKUP.get(tok.strip().replace("_", " ").lower())
+
+
+# Word splitter for filename/title text, and a chapter number (Arabic or Roman) token
+_TOKEN_SPLIT_RE = re.compile(r"[^a-z0-9_]+")
+_CHAPTER_TOKEN_RE = re.compile(r"\b(\d{1,3}|[ivxlcdm]{1,6})\b")
 
 
 def heuristic_suggest(filename: str, title: str) -> List[Tuple[str, int, float, str]]:
@@ -182,14 +186,14 @@ def heuristic_suggest(filename: str, title: str) -> List[Tuple[str, int, float,
     suggestions: List[Tuple[str, int, float, str]] = []
 
     # Find explicit book tokens
-    tokens = re.split(r"[^a-z0-9_]+", hay)
+    tokens = _TOKEN_SPLIT_RE.split(hay)
     for i, tok in enumerate(tokens):
         book = normalize_book_token(tok)
         if not book:
             continue
         # Look ahead for a roman or arabic number near
         window = " ".join(tokens[i + 1 : i + 6])
-        m = re.search(r"\b(\d{1,3}|[ivxlcdm]{1,6})\b", window)
+        m = _CHAPTER_TOKEN_RE.search(window)
         chap: Optional[int] = None
         if m:
             g = m.group(1)
@@ -222,6 +226,10 @@ def heuristic_suggest(filename: str, title: str) -> List[Tuple[str, int, float,
     return out[:3]
 
 
+# Shared keep-alive connection, so each suggestion after the first skips the TLS handshake
+_http = requests.Session()
+
+
 def openrouter_suggest(
     filename: str, title: str, model: str, api_key: str
 ) -> List[Tuple[str, int, float, str]]:
@@ -254,7 +262,7 @@ def openrouter_suggest(
         "Content-Type": "application/json",
     }
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=60)
+        r = _http.post(url, headers=headers, json=payload, timeout=60)
         r.raise_for_status()
         data = r.json()
         content = data["choices"][0]["message"]["content"]
@@ -284,7 +292,11 @@ def load_json(path: Path, default):
 
 
 def save_json(path: Path, obj) -> None:
-    path.write_text(json.dumps(obj, indent=2, ensure_ascii=False))
+    # Write a sibling temp file and swap it in, so an interrupted save never
+    # leaves a truncated map behind
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, path)
 
 
 def allocate_next_free_chapter(
@@ -320,6 +332,38 @@ def allocate_next_free_chapter(
     return desired_chap
 
 
+# Manually typed reference, e.g. "Genesis 22" or "I Kings 3"
+_MANUAL_REF_RE = re.compile(r"^\s*([A-Za-z_ ]+)\s+(\d{1,3})\s*$")
+
+
+def parse_manual_ref(text: str) -> Optional[Tuple[str, int]]:
+    """Parse a typed "Book Chapter" into (canonical book, chapter), or None if malformed."""
+    m = _MANUAL_REF_RE.match(text)
+    if not m:
+        return None
+    book_in = m.group(1).strip()
+    norm = normalize_book_token(book_in) or book_in.replace(" ", "_")
+    return norm, int(m.group(2))
+
+
+def record_placement(
+    fn: str,
+    book: str,
+    chap: int,
+    placement: Dict[str, List[str]],
+    map_path: Path,
+    duplicates_moved: List[Tuple[str, str, int, int]],
+) -> Tuple[int, str]:
+    """Assign fn to book/chap (or the next free chapter), save the map, return (chapter, note)."""
+    chap2 = allocate_next_free_chapter(book, chap, placement)
+    placement[fn] = [f"{book} {chap2}"]
+    save_json(map_path, placement)
+    if chap2 != chap:
+        duplicates_moved.append((fn, book, chap, chap2))
+        return chap2, " (moved to end)"
+    return chap2, ""
+
+
 def main():
     load_dotenv()
     parser = argparse.ArgumentParser()
@@ -411,14 +455,7 @@ def main():
         # Auto-accept if highly confident (>= 0.8)
         if suggestions and suggestions[0][2] >= 0.8:
             b, c, conf, _ = suggestions[0]
-            c2 = allocate_next_free_chapter(b, c, placement)
-            placement[fn] = [f"{b} {c2}"]
-            save_json(map_path, placement)
-            if c2 != c:
-                duplicates_moved.append((fn, b, c, c2))
-                note = " (moved to end)"
-            else:
-                note = ""
+            c2, note = record_placement(fn, b, c, placement, map_path, duplicates_moved)
             print(f"  Auto-accepted: {b} {c2}{note} (p≈{conf:.2f})")
             continue
         if suggestions:
@@ -442,36 +479,18 @@ def main():
                     save_json(map_path, placement)
                     sys.exit(2 if args.strict else 0)
                 if choice == "m":
-                    manual = input("  Enter Book Chapter (e.g., Genesis 22): ").strip()
-                    m = re.match(r"^\s*([A-Za-z_ ]+)\s+(\d{1,3})\s*$", manual)
-                    if not m:
+                    ref = parse_manual_ref(input("  Enter Book Chapter (e.g., Genesis 22): "))
+                    if not ref:
                         print("  Invalid format, try again.")
                         continue
-                    book_in = m.group(1).strip()
-                    chap = int(m.group(2))
-                    norm = normalize_book_token(book_in) or book_in.replace(" ", "_")
-                    chap2 = allocate_next_free_chapter(norm, chap, placement)
-                    placement[fn] = [f"{norm} {chap2}"]
-                    save_json(map_path, placement)
-                    if chap2 != chap:
-                        duplicates_moved.append((fn, norm, chap, chap2))
-                        note = " (moved to end)"
-                    else:
-                        note = ""
+                    _, note = record_placement(fn, *ref, placement, map_path, duplicates_moved)
                     print(f"  Saved: {placement[fn]}{note}")
                     break
                 if choice.isdigit():
                     k = int(choice)
                     if 1 <= k <= len(suggestions):
                         b, c, *_ = suggestions[k - 1]
-                        c2 = allocate_next_free_chapter(b, c, placement)
-                        placement[fn] = [f"{b} {c2}"]
-                        save_json(map_path, placement)
-                        if c2 != c:
-                            duplicates_moved.append((fn, b, c, c2))
-                            note = " (moved to end)"
-                        else:
-                            note = ""
+                        _, note = record_placement(fn, b, c, placement, map_path, duplicates_moved)
                         print(f"  Saved: {placement[fn]}{note}")
                         break
                     else:
@@ -493,36 +512,18 @@ def main():
                 save_json(map_path, placement)
                 return
             if choice == "m":
-                manual = input("Enter Book Chapter (e.g., Genesis 22): ").strip()
-                m = re.match(r"^\s*([A-Za-z_ ]+)\s+(\d{1,3})\s*$", manual)
-                if not m:
+                ref = parse_manual_ref(input("Enter Book Chapter (e.g., Genesis 22): "))
+                if not ref:
                     print("  Invalid format, try again.")
                     continue
-                book_in = m.group(1).strip()
-                chap = int(m.group(2))
-                norm = normalize_book_token(book_in) or book_in.replace(" ", "_")
-                chap2 = allocate_next_free_chapter(norm, chap, placement)
-                placement[fn] = [f"{norm} {chap2}"]
-                save_json(map_path, placement)
-                if chap2 != chap:
-                    duplicates_moved.append((fn, norm, chap, chap2))
-                    note = " (moved to end)"
-                else:
-                    note = ""
+                _, note = record_placement(fn, *ref, placement, map_path, duplicates_moved)
                 print(f"  Saved: {placement[fn]}{note}")
                 break
             if choice.isdigit():
                 k = int(choice)
                 if 1 <= k <= len(suggestions):
                     b, c, *_ = suggestions[k - 1]
-                    c2 = allocate_next_free_chapter(b, c, placement)
-                    placement[fn] = [f"{b} {c2}"]
-                    save_json(map_path, placement)
-                    if c2 != c:
-                        duplicates_moved.append((fn, b, c, c2))
-                        note = " (moved to end)"
-                    else:
-                        note = ""
+                    _, note = record_placement(fn, b, c, placement, map_path, duplicates_moved)
                     print(f"  Saved: {placement[fn]}{note}")
                     break
                 else: